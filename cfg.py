@@ -1,113 +1,292 @@
 import logging
 import string
-from itertools import chain
-from typing import Dict, NamedTuple, Set, Tuple, TextIO
+from dataclasses import dataclass, field, replace
+from itertools import chain, product, takewhile
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple, TextIO
 
 logger = logging.getLogger(__name__)
 
 
-class CFG(NamedTuple):
+def _first_of(symbols, table: List[int], epsilon: int) -> int:
+    first = 0
+
+    for y in symbols:
+        first |= table[y] & ~epsilon
+
+        if not table[y] & epsilon:
+            return first
+
+    # if for never breaks, & in first(yk)
+    return first | epsilon
+
+
+def _bits(mask: int):
+    while mask:
+        bit = mask & -mask
+        yield bit.bit_length() - 1
+        mask ^= bit
+
+
+def _components(graph: List[int], nodes: List[int]):
+    # Tarjan's strongly connected components, iterative, over bitset rows
+    order, low, stack, on_stack = {}, {}, [], set()
+
+    for root in nodes:
+        if root in order:
+            continue
+
+        order[root] = low[root] = len(order)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, _bits(graph[root]))]
+
+        while work:
+            v, successors = work[-1]
+            for w in successors:
+                if w not in order:
+                    order[w] = low[w] = len(order)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, _bits(graph[w])))
+                    break
+
+                if w in on_stack:
+                    low[v] = min(low[v], order[w])
+
+            # all successors of v visited
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+
+                if low[v] == order[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+
+                    yield component
+
+
+class _Rejected(Exception):
+    pass
+
+
+def _drive(tokens: List[int], stack: List[int], table: List[Optional[Tuple[int, ...]]], columns: int):
+    # LL(1) stack machine over symbol ids: yields the position of the next
+    # token after each step and raises _Rejected(top) when input is rejected
+    end = stack[0]
+    pop, extend = stack.pop, stack.extend
+    i, front = 0, tokens[0]
+
+    while True:
+        top = pop()
+
+        # sentence is over
+        if top == front == end:
+            return
+
+        if 0 <= top < end:
+            if top != front:
+                raise _Rejected(top)
+
+            i += 1
+            front = tokens[i]
+
+        # $ and symbols out of the grammar (-1) have no row in the table
+        else:
+            rule = table[(top - columns - 1) * columns + front] if top > columns and front >= 0 else None
+            if rule is None:
+                raise _Rejected(top)
+
+            extend(rule)
+
+        yield i
+
+
+@dataclass(frozen=True)
+class CFG:
     initial_symbol: str
-    productions: Dict[str, Set[str]]
+    productions: Dict[str, FrozenSet[Tuple[str, ...]]]
     nonterminals: Set[str]
     terminals: Set[str]
+    # tables derived from the fields above, filled lazily and never copied
+    cache: Dict = field(default_factory=dict, init=False, compare=False, repr=False)
 
-    def first(self, sentence: str, visited=set()) -> Set[str]:
-        first = set()
-        visited |= {sentence}
+    def _replace(self, **changes):
+        return replace(self, **changes)
 
-        # compute transitive closure of first(yn)
-        for y in sentence.split():
-            # first of terminal is itself
-            if y not in self.nonterminals:
-                visited -= {sentence}
-                return first | {y}
+    def first(self, sentence: str) -> Set[str]:
+        symbols, index = self._compute_index()
+        epsilon = 1 << index['&']
 
-            first_y = set()
-            for x in self.productions[y]:
-                if x not in visited:
-                    first_y |= self.first(x)
+        sentence = sentence.split()
+        known = list(takewhile(index.__contains__, sentence))
+        first = _first_of((index[y] for y in known), self._compute_first_table(), epsilon)
+        ret = {symbols[i] for i in _bits(first)}
 
-            first |= (first_y - {'&'})
+        # symbol out of the grammar is first of itself
+        if len(known) < len(sentence) and first & epsilon:
+            ret = (ret - {'&'}) | {sentence[len(known)]}
 
-            if '&' not in first_y:
-                visited -= {sentence}
-                return first
+        return ret
 
-        visited -= {sentence}
+    def _compute_index(self) -> Tuple[List[str], Dict[str, int]]:
+        if 'index' in self.cache:
+            return self.cache['index']
 
-        # if for never breaks, & in first(yk)
-        return first | {'&'}
+        # terminals come first so their bits are the low ones in every set
+        symbols = sorted(self.terminals) + ['$', '&'] + sorted(self.nonterminals)
+        index = {symbol: i for i, symbol in enumerate(symbols)}
 
-    def first_nonterminal(self, symbol: str, visited=set()) -> Set[str]:
-        if symbol in self.terminals:
-            return set()
+        self.cache['index'] = symbols, index
+        return symbols, index
+
+    def _compute_first_table(self) -> List[int]:
+        if 'first_table' in self.cache:
+            return self.cache['first_table']
+
+        symbols, index = self._compute_index()
+        epsilon = 1 << index['&']
 
+        nonterminals = self.nonterminals
+        rules = [
+            (index[symbol], tuple(index[y] for y in production))
+            for symbol, productions in self.productions.items()
+            for production in productions
+        ]
+
+        # first of terminal is itself, first of nonterminal grows to a fixed point
+        table = [0 if symbol in nonterminals else 1 << i for i, symbol in enumerate(symbols)]
+
+        changed = True
+        while changed:
+            changed = False
+            for i, rule in rules:
+                first = _first_of(rule, table, epsilon)
+                if first & ~table[i]:
+                    table[i] |= first
+                    changed = True
+
+        self.cache['first_table'] = table
+        return table
+
+    def first_nonterminal(self, symbol: str) -> Set[str]:
+        symbols, index = self._compute_index()
         if symbol == '&':
             return {symbol}
 
-        visited |= {symbol}
+        if symbol not in self.nonterminals:
+            return set()
+
+        i = index[symbol]
+        first = {symbols[j] for j in _bits(self._compute_first_nonterminal_table()[i])}
 
-        first = set()
-        if '&' in self.productions[symbol]:
+        if self._compute_first_table()[i] & (1 << index['&']):
             first |= {'&'}
 
-        for production in (p.split() for p in self.productions[symbol]):
-            # compute transitive closure of first_nonterminal(yn)
-            for y in production:
-                if y in self.nonterminals:
-                    first |= {y}
+        return first
 
-                if y in visited:
-                    continue
-                first_y = self.first_nonterminal(y, visited=visited)
-                first |= (first_y - {'&'})
+    def _compute_left_graph(self) -> List[int]:
+        if 'left_graph' in self.cache:
+            return self.cache['left_graph']
 
-                if '&' not in first_y:
-                    break
+        symbols, index = self._compute_index()
+        epsilon = 1 << index['&']
+        first_table = self._compute_first_table()
+        nonterminals = self.nonterminals
 
-            # if for never breaks, & in first(yk)
-            else:
-                first |= {'&'}
+        # A -> B whenever B may lead a production of A, one bitset row per symbol
+        graph = [0] * len(symbols)
+        for symbol, productions in self.productions.items():
+            i = index[symbol]
+            for production in productions:
+                for y in production:
+                    j = index[y]
+                    if y in nonterminals:
+                        graph[i] |= 1 << j
+
+                    if not first_table[j] & epsilon:
+                        break
+
+        self.cache['left_graph'] = graph
+        return graph
+
+    def _compute_first_nonterminal_table(self) -> List[int]:
+        if 'first_nonterminal_table' in self.cache:
+            return self.cache['first_nonterminal_table']
+
+        _, index = self._compute_index()
+        table = list(self._compute_left_graph())
+        nonterminals = [index[x] for x in self.nonterminals]
+
+        # transitive closure (Warshall) with each row as a bitset
+        for k in nonterminals:
+            bit = 1 << k
+            for i in nonterminals:
+                if table[i] & bit:
+                    table[i] |= table[k]
+
+        self.cache['first_nonterminal_table'] = table
+        return table
 
-        visited -= {symbol}
+    def follow(self, symbol: str) -> Set[str]:
+        symbols, index = self._compute_index()
+        if symbol not in index:
+            return set()
+        return {symbols[i] for i in _bits(self._compute_follow_table()[index[symbol]])}
 
-        return first
+    def _compute_follow_table(self) -> List[int]:
+        if 'follow_table' in self.cache:
+            return self.cache['follow_table']
 
-    def follow(self, symbol: str, visited=set()) -> Set[str]:
-        ret = set()
-        visited |= {symbol}
+        symbols, index = self._compute_index()
+        epsilon = 1 << index['&']
+        first_table = self._compute_first_table()
 
-        if symbol == self.initial_symbol:
-            ret |= {'$'}
+        table = [0] * len(symbols)
+        if self.initial_symbol in index:
+            table[index[self.initial_symbol]] = 1 << index['$']
 
+        # follow(k) flows into follow(y) when y may end a production of k
+        subsets = [set() for _ in symbols]
         for k, v in self.productions.items():
-            for production in (p.split() for p in v):
-                piece = production
-                while symbol in piece:
-                    piece = piece[production.index(symbol) + 1:]
+            for production in v:
+                # first of what comes after y, grown right to left
+                trailer, nullable = 0, True
+                for y in reversed(production):
+                    if y == '&':
+                        continue
 
-                    for y in piece:
-                        first = self.first(y)#, visited=visited | {y})
-                        ret |= (first - {'&'})
+                    i = index[y]
+                    table[i] |= trailer
 
-                        if '&' not in first:
-                            break
+                    if nullable and y != k:
+                        subsets[index[k]].add(i)
 
-                    # if for never breaks, symbol might be last of production
+                    if first_table[i] & epsilon:
+                        trailer |= first_table[i] & ~epsilon
                     else:
-                        if symbol != k and k not in visited:
-                            ret |= self.follow(k, visited=visited)
+                        trailer, nullable = first_table[i], False
 
-        visited -= {symbol}
-        return ret
+        worklist = [i for i, follow in enumerate(table) if follow]
+        while worklist:
+            k = worklist.pop()
+            for y in subsets[k]:
+                if table[k] & ~table[y]:
+                    table[y] |= table[k]
+                    worklist.append(y)
+
+        self.cache['follow_table'] = table
+        return table
 
     def is_ll1(self) -> bool:
-        def has_left_recursion() -> bool:
-            for x in self.nonterminals:
-                if x in self.first_nonterminal(x):
-                    return True
-            return False
+        _, index = self._compute_index()
+        nonterminals = [index[x] for x in self.nonterminals]
 
         def is_factored() -> bool:
             for y in self.productions.values():
@@ -115,95 +294,144 @@ class CFG(NamedTuple):
                     return False
             return True
 
-        def has_ambiguity():
-            for x in self.nonterminals:
-                first = self.first(x)
-                if '&' not in first:
+        def has_ambiguity() -> bool:
+            epsilon = 1 << index['&']
+            first_table = self._compute_first_table()
+            follow_table = self._compute_follow_table()
+            for x in nonterminals:
+                first = first_table[x]
+                if not first & epsilon:
                     continue
 
-                if first & self.follow(x):
+                if first & follow_table[x]:
+                    return True
+            return False
+
+        def has_left_recursion() -> bool:
+            # built on top of first table, already cached by has_ambiguity
+            graph = self._compute_left_graph()
+
+            # a cycle in the leftmost derivation graph is a left recursion
+            for component in _components(graph, nonterminals):
+                if len(component) > 1 or graph[component[0]] >> component[0] & 1:
                     return True
             return False
 
-        return not has_left_recursion() and is_factored() and not has_ambiguity()
+        # cheapest checks first, tables are only built when needed
+        return is_factored() and not has_ambiguity() and not has_left_recursion()
 
     def parse_table(self) -> Dict[Tuple[str, str], str]:
-        table = {}
+        symbols, _ = self._compute_index()
+        columns = len(self.terminals) + 1
+        offset = columns + 1
+
+        return {
+            (symbols[offset + i // columns], symbols[i % columns]): ' '.join(symbols[y] for y in reversed(rule)) or '&'
+            for i, rule in enumerate(self._compute_parse_table())
+            if rule is not None
+        }
+
+    def _compute_parse_table(self) -> List[Optional[Tuple[int, ...]]]:
+        if 'parse_table' in self.cache:
+            return self.cache['parse_table']
+
+        symbols, index = self._compute_index()
+        epsilon = 1 << index['&']
+        first_table = self._compute_first_table()
+        follow_table = self._compute_follow_table()
+
+        # one row per nonterminal, one column per terminal plus $
+        columns = len(self.terminals) + 1
+        offset = columns + 1
+        table = [None] * (len(self.nonterminals) * columns)
 
         for nt, p in ((x, y) for x, v in self.productions.items() for y in v):
-            for symbol in p.split():
-                first = self.first(symbol)
+            row = (index[nt] - offset) * columns
+            first = _first_of((index[y] for y in p), first_table, epsilon)
 
-                for t in (first - {'&'}):
-                    table[(nt, t)] = p
+            # rules are kept reversed, ready to be pushed onto the stack
+            rule = tuple(index[y] for y in reversed(p) if y != '&')
 
-                if '&' not in first:
-                    break
-            else:
-                for t in self.follow(nt):
-                    table[(nt, t)] = p
+            for t in _bits(first & ~epsilon):
+                table[row + t] = rule
+
+            # if production is nullable, follow(nt) selects it as well
+            if first & epsilon:
+                for t in _bits(follow_table[index[nt]]):
+                    table[row + t] = rule
 
+        self.cache['parse_table'] = table
         return table
 
     def parse(self, sentence: str):
-        table = self.parse_table()
+        symbols, index = self._compute_index()
+        columns = len(self.terminals) + 1
 
+        # symbols are translated to ids once; -1 stands for input tokens out of
+        # the grammar, which _drive rejects through its front >= 0 check, and
+        # for an initial symbol with no productions, which has no table row
         sentence = sentence.split() + ['$']
-        stack = ['$', self.initial_symbol]
+        tokens = [index[t] if t in self.terminals or t == '$' else -1 for t in sentence]
+        stack = [index['$'], index.get(self.initial_symbol, -1)]
 
-        yield sentence[:-1], stack[1:]
+        def name(y):
+            return symbols[y] if y >= 0 else self.initial_symbol
 
-        while True:
-            front, top = sentence[0], stack.pop()
-
-            # we stacked empty symbol
-            if top == '&':
-                continue
+        # steps carry the position of the next unread token, not a copy of the
+        # unread input, so a whole parse stays linear in the sentence length
+        yield 0, [name(y) for y in stack[1:]]
 
-            # sentence is over
-            if top == front == '$':
-                break
+        i, steps = 0, _drive(tokens, stack, self._compute_parse_table(), columns)
+        while True:
+            try:
+                i = next(steps)
 
-            if top in self.terminals:
-                if top != front:
-                    raise ValueError(f'{top} != {front}')
+            except StopIteration:
+                return
 
-                _, *sentence = sentence
+            except _Rejected as e:
+                top, front = name(e.args[0]), sentence[i]
+                if 0 <= e.args[0] < index['$']:
+                    raise ValueError(f'{top} != {front}') from None
+                raise ValueError(f'there is no ({top}, {front}) in parse table') from None
 
-            else:
-                rule = table.get((top, front))
-                if rule:
-                    if rule != '&':
-                        stack.extend(reversed(rule.split()))
+            yield i, [name(y) for y in stack[1:]]
 
-                else:
-                    raise ValueError(f'there is no ({top}, {front}) in parse table')
+    def without_infertile(self):
+        # productions each nonterminal appears in, and how many distinct
+        # nonterminals of each production are not known to be fertile yet
+        nonterminals = self.nonterminals
+        uses, remaining, worklist = {}, {}, []
+        for symbol, productions in self.productions.items():
+            for production in productions:
+                pending = {y for y in production if y in nonterminals}
+                remaining[(symbol, production)] = len(pending)
+                for y in pending:
+                    uses.setdefault(y, []).append((symbol, production))
+
+                if not pending:
+                    worklist.append((symbol, production))
+
+        fertile = self.terminals | {'&'}
+        while worklist:
+            symbol, _ = worklist.pop()
+            if symbol in fertile:
+                continue
 
-            yield sentence[:-1], stack[1:]
+            fertile.add(symbol)
+            for use in uses.get(symbol, ()):
+                remaining[use] -= 1
+                if not remaining[use]:
+                    worklist.append(use)
 
-    def without_infertile(self):
-        def fertile(ni):
-            for symbol in ni:
-                yield symbol
-
-            allowed = ni | self.terminals | {'&'}
-            for symbol, productions in self.productions.items():
-                for ys in (set(p.split()) for p in productions):
-                    if ys <= allowed:
-                        yield symbol
-
-        ni, next_ni = set(), set(fertile(set()))
-        while ni != next_ni:
-            ni, next_ni = set(next_ni), set(fertile(next_ni))
-
-        fertile = ni | self.terminals | {'&'}
-        return self.create(
+        # a production is fertile once none of its nonterminals is pending
+        return self._create(
             initial_symbol=self.initial_symbol,
             productions={
                 symbol: {
                     production
                     for production in productions
-                    if all(v in fertile for v in production.split())
+                    if not remaining[(symbol, production)]
                 }
                 for symbol, productions in self.productions.items()
                 if symbol in fertile
@@ -211,43 +439,50 @@ class CFG(NamedTuple):
         )
 
     def epsilon_free(self):
-        for symbol, productions in self.productions.items():
-            prod_ = list(productions)
-            for destiny in prod_:
-                for i, char in enumerate(destiny):
-                    if char == ' ':
-                        continue
-                    if '&' in self.first(char):
-                        new_prod = (destiny[:i] + destiny[i:].replace(char, '', 1)).replace('  ', ' ').strip()
-                        prod_.append(new_prod)
-                        self.productions[symbol] |= {new_prod}
-
-        for symbol, productions in self.productions.items():
-            if symbol != self.initial_symbol:
-                self.productions[symbol] -= {'&'}
-            self.productions[symbol] -= {''}
-
+        _, index = self._compute_index()
+        epsilon = 1 << index['&']
+        first_table = self._compute_first_table()
+
+        productions = {}
+        for symbol, rhs in self.productions.items():
+            productions[symbol] = set()
+            for production in rhs - {('&',)}:
+                # every nullable symbol may be either kept or dropped, those
+                # deriving nothing but & are always dropped
+                choices = [
+                    ((),) if first_table[index[y]] == epsilon
+                    else ((y,), ()) if first_table[index[y]] & epsilon
+                    else ((y,),)
+                    for y in production
+                ]
+                productions[symbol] |= {tuple(chain.from_iterable(p)) for p in product(*choices)} - {()}
+
+        # a nullable initial symbol hands & over to a new one, which only refers
+        # back to the old one if it derives something besides &
         initial = self.initial_symbol
-        if '&' in self.first(initial):
-            self.productions[initial] -= {'&'}
-            self.productions[f"{initial}'"] = {initial, '&'}
+        if first_table[index[initial]] & epsilon:
+            productions[f"{initial}'"] = {('&',)}
+            if first_table[index[initial]] != epsilon:
+                productions[f"{initial}'"] |= {(initial,)}
             initial = f"{initial}'"
 
-        return self.create(
+        return self._create(
                 initial_symbol=initial,
-                productions={symbol: p for symbol, p in self.productions.items() if len(p) != 0}
+                productions={symbol: p for symbol, p in productions.items() if len(p) != 0}
                 )
 
     def __str__(self):
-        alphabet = self.initial_symbol + string.ascii_letters + '&'
+        alphabet = [self.initial_symbol, *string.ascii_letters, '&']
+        order = {c: i for i, c in reversed(list(enumerate(alphabet)))}
 
+        # symbols out of the alphabet (e.g. id, E') go last, by name
         def key(word):
-            return [alphabet.index(c) for c in word.split()]
+            return [(order.get(c, len(alphabet)), c) for c in word]
 
         output = []
-        for symbol in [self.initial_symbol] + sorted(set(self.productions.keys()) - {self.initial_symbol}, key=key):
+        for symbol in [self.initial_symbol] + sorted(set(self.productions.keys()) - {self.initial_symbol}, key=lambda x: key([x])):
             productions = sorted(self.productions[symbol], key=key)
-            output.append(f"{symbol} -> {' | '.join(productions)}")
+            output.append(f"{symbol} -> {' | '.join(' '.join(p) for p in productions)}")
 
         return "<CFG initial_symbol='{}' productions={{\n\t{}\n}}>".format(
             self.initial_symbol,
@@ -256,18 +491,28 @@ class CFG(NamedTuple):
 
     @classmethod
     def create(cls, initial_symbol: str, productions: Dict[str, Set[str]]):
+        return cls._create(
+            initial_symbol=initial_symbol,
+            productions={
+                symbol: {tuple(p.split()) for p in v}
+                for symbol, v in productions.items()
+            }
+        )
+
+    @classmethod
+    def _create(cls, initial_symbol: str, productions: Dict[str, Set[Tuple[str, ...]]]):
         nonterminals = set(productions.keys())
 
         return cls(
             initial_symbol=initial_symbol,
-            productions=productions,
+            productions={symbol: frozenset(v) for symbol, v in productions.items()},
             nonterminals=nonterminals,
             terminals={
                 symbol
                 for production in chain.from_iterable(productions.values())
-                for symbol in production.split()
+                for symbol in production
                 if symbol != '&' and symbol not in nonterminals
-            }
+            },
         )
 
     @classmethod
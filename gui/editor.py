@@ -224,7 +224,7 @@ class GLCEditor:
             result = 'Reject'
 
         if ParseResultDialog(self.window, result).show() == 1:
-            ParseStepViewer(self.window, steps).show()
+            ParseStepViewer(self.window, self.test_string_edit.text().split(), steps).show()
 
     def show_parse_table(self):
         '''Shows LL(1) parsing table.'''
@@ -63,7 +63,7 @@ class ParseResultDialog(QDialog):
         return self.msg_box.exec_()
 
 class ParseStepViewer(QDialog):
-    def __init__(self, parent, steps):
+    def __init__(self, parent, sentence, steps):
         super(ParseStepViewer, self).__init__(parent)
         self.setModal(True)
         self.setWindowTitle('Parse steps view.')
@@ -78,9 +78,9 @@ class ParseStepViewer(QDialog):
 
         self.table.setHorizontalHeaderLabels(['Stack', 'Input'])
 
-        for row, (right, left) in enumerate(steps):
-            self.table.setItem(row, 0, QTableWidgetItem('$' + ''.join(left)))
-            self.table.setItem(row, 1, QTableWidgetItem(''.join(right) + '$'))
+        for row, (cursor, stack) in enumerate(steps):
+            self.table.setItem(row, 0, QTableWidgetItem('$' + ''.join(stack)))
+            self.table.setItem(row, 1, QTableWidgetItem(''.join(sentence[cursor:]) + '$'))
 
         self.table.resizeColumnsToContents()
 
@@ -65,6 +65,18 @@ class CFGTest(unittest.TestCase):
         )
         self.assertEqual({'a', 'b'}, cfg.first('S'))
 
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {'E + T', 'T'},
+                'T': {'T * F', 'F'},
+                'F': {'( E )', 'id'},
+            },
+        )
+        self.assertSetEqual({'(', 'id'}, cfg.first('E'))
+        self.assertSetEqual({'(', 'id'}, cfg.first('T'))
+        self.assertSetEqual({'+'}, cfg.first('+ T'))
+
     def test_first_nt(self):
         cfg = CFG.create(
             initial_symbol='S',
@@ -158,6 +170,56 @@ class CFGTest(unittest.TestCase):
         self.assertSetEqual({'$', 'a', 'b'}, cfg.follow('A'))
         self.assertSetEqual({'$', 'a', 'b'}, cfg.follow('B'))
 
+    def test_queries_do_not_share_state(self):
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A B C'},
+                'A': {'a A', '&'},
+                'B': {'b B', 'A C d'},
+                'C': {'c C', '&'},
+            },
+        )
+        other = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'a A'},
+                'A': {'b', '&'},
+            },
+        )
+
+        expected = {
+            'S': ({'a', 'b', 'c', 'd'}, {'$'}, {'A', 'B', 'C'}),
+            'A': ({'a', '&'}, {'a', 'b', 'c', 'd'}, {'&'}),
+            'B': ({'a', 'b', 'c', 'd'}, {'c', '$'}, {'A', 'C'}),
+            'C': ({'c', '&'}, {'d', '$'}, {'&'}),
+        }
+
+        # same symbols queried in different orders, interleaved with another
+        # grammar using the same names
+        for x in 'CBAS':
+            self.assertSetEqual(expected[x][2], cfg.first_nonterminal(x))
+            self.assertSetEqual({'$'}, other.follow('A'))
+            self.assertSetEqual(expected[x][1], cfg.follow(x))
+            self.assertSetEqual({'a'}, other.first('S'))
+            self.assertSetEqual(expected[x][0], cfg.first(x))
+
+        for x in 'SABC':
+            self.assertTupleEqual(expected[x], (cfg.first(x), cfg.follow(x), cfg.first_nonterminal(x)))
+            self.assertSetEqual({'b', '&'}, other.first('A'))
+
+    def test_cache_is_not_part_of_value(self):
+        productions = {
+            'S': {'A b'},
+            'A': {'a'},
+        }
+
+        cfg = CFG.create(initial_symbol='S', productions=productions)
+        self.assertSetEqual({'b'}, cfg.follow('A'))
+        self.assertEqual(CFG.create(initial_symbol='S', productions=productions), cfg)
+        self.assertNotIn('cache', repr(cfg))
+        self.assertSetEqual({'$', 'b'}, cfg._replace(initial_symbol='A').follow('A'))
+
     def test_is_ll1(self):
         cfg = CFG.create(
             initial_symbol='S',
@@ -168,6 +230,51 @@ class CFGTest(unittest.TestCase):
 
         self.assertFalse(cfg.is_ll1())
 
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A S b', 'c'},
+                'A': {'a', '&'},
+            }
+        )
+
+        self.assertFalse(cfg.is_ll1())
+
+        # factored and free of conflicts, left recursive through nullable A
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A S b', 'c'},
+                'A': {'&'},
+            }
+        )
+
+        self.assertFalse(cfg.is_ll1())
+
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A b'},
+                'A': {'B c', 'a'},
+                'B': {'S d', 'e'},
+            }
+        )
+
+        self.assertFalse(cfg.is_ll1())
+
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {"T E'"},
+                "E'": {"+ T E'", '&'},
+                'T': {"F T'"},
+                "T'": {"* F T'", '&'},
+                'F': {'( E )', 'id'}
+            },
+        )
+
+        self.assertTrue(cfg.is_ll1())
+
     def test_parse_table(self):
         cfg = CFG.create(
             initial_symbol='E',
@@ -210,23 +317,39 @@ class CFGTest(unittest.TestCase):
 
         parse = cfg.parse('id + id')
 
-        self.assertTupleEqual((['id', '+', 'id'], ['E']), next(parse))
-        self.assertTupleEqual((['id', '+', 'id'], ["E'", 'T']), next(parse))
-        self.assertTupleEqual((['id', '+', 'id'], ["E'", "T'", 'F']), next(parse))
-        self.assertTupleEqual((['id', '+', 'id'], ["E'", "T'", 'id']), next(parse))
-        self.assertTupleEqual((['+', 'id'], ["E'", "T'"]), next(parse))
-        self.assertTupleEqual((['+', 'id'], ["E'"]), next(parse))
-        self.assertTupleEqual((['+', 'id'], ["E'", 'T', '+']), next(parse))
-        self.assertTupleEqual((['id'], ["E'", 'T']), next(parse))
-        self.assertTupleEqual((['id'], ["E'", "T'", 'F']), next(parse))
-        self.assertTupleEqual((['id'], ["E'", "T'", 'id']), next(parse))
-        self.assertTupleEqual(([], ["E'", "T'"]), next(parse))
-        self.assertTupleEqual(([], ["E'"]), next(parse))
-        self.assertTupleEqual(([], []), next(parse))
+        self.assertTupleEqual((0, ['E']), next(parse))
+        self.assertTupleEqual((0, ["E'", 'T']), next(parse))
+        self.assertTupleEqual((0, ["E'", "T'", 'F']), next(parse))
+        self.assertTupleEqual((0, ["E'", "T'", 'id']), next(parse))
+        self.assertTupleEqual((1, ["E'", "T'"]), next(parse))
+        self.assertTupleEqual((1, ["E'"]), next(parse))
+        self.assertTupleEqual((1, ["E'", 'T', '+']), next(parse))
+        self.assertTupleEqual((2, ["E'", 'T']), next(parse))
+        self.assertTupleEqual((2, ["E'", "T'", 'F']), next(parse))
+        self.assertTupleEqual((2, ["E'", "T'", 'id']), next(parse))
+        self.assertTupleEqual((3, ["E'", "T'"]), next(parse))
+        self.assertTupleEqual((3, ["E'"]), next(parse))
+        self.assertTupleEqual((3, []), next(parse))
 
         with self.assertRaises(StopIteration):
             next(parse)
 
+        with self.assertRaisesRegex(ValueError, r'there is no \(\$, \)\) in parse table'):
+            list(cfg.parse('id )'))
+
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'S a'},
+                'A': {'a'},
+            },
+        ).without_infertile()
+
+        parse = cfg.parse('a')
+        self.assertTupleEqual((0, ['S']), next(parse))
+        with self.assertRaisesRegex(ValueError, r'there is no \(S, a\) in parse table'):
+            next(parse)
+
     def test_without_infertile(self):
         cfg = CFG.create(
             initial_symbol='S',
@@ -239,7 +362,7 @@ class CFGTest(unittest.TestCase):
         fertile = cfg.without_infertile()
         self.assertEqual('S', fertile.initial_symbol)
         self.assertDictEqual({
-            'S': {'a'}
+            'S': {('a',)}
         }, fertile.productions)
 
         cfg = CFG.create(
@@ -252,8 +375,8 @@ class CFGTest(unittest.TestCase):
 
         fertile = cfg.without_infertile()
         self.assertEqual({
-            'S': {'A a A b'},
-            'A': {'c', '&'},
+            'S': {('A', 'a', 'A', 'b')},
+            'A': {('c',), ('&',)},
         }, fertile.productions)
 
     def test_epsilon_free(self):
@@ -268,9 +391,13 @@ class CFGTest(unittest.TestCase):
         epsilon_free = cfg.epsilon_free()
         self.assertEqual('S', epsilon_free.initial_symbol)
         self.assertDictEqual({
-            'S': {'a A b', 'A a b', 'a b', 'A a A b'},
-            'A': {'c'},
+            'S': {('a', 'A', 'b'), ('A', 'a', 'b'), ('a', 'b'), ('A', 'a', 'A', 'b')},
+            'A': {('c',)},
         }, epsilon_free.productions)
+        self.assertDictEqual({
+            'S': {('A', 'a', 'A', 'b')},
+            'A': {('c',), ('&',)},
+        }, cfg.productions)
 
         cfg = CFG.create(
             initial_symbol='S',
@@ -282,9 +409,79 @@ class CFGTest(unittest.TestCase):
         epsilon_free = cfg.epsilon_free()
         self.assertEqual("S'", epsilon_free.initial_symbol)
         self.assertDictEqual({
-            "S'": {'S', '&'},
+            "S'": {('&',)},
+        }, epsilon_free.productions)
+        self.assertNotIn('S', epsilon_free.terminals)
+
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A B'},
+                'A': {'a', '&'},
+                'B': {'b', '&'},
+            },
+        )
+
+        epsilon_free = cfg.epsilon_free()
+        self.assertEqual("S'", epsilon_free.initial_symbol)
+        self.assertDictEqual({
+            "S'": {('S',), ('&',)},
+            'S': {('A', 'B'), ('A',), ('B',)},
+            'A': {('a',)},
+            'B': {('b',)},
         }, epsilon_free.productions)
 
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'a B', 'B'},
+                'A': {'b'},
+                'B': {'&'},
+            },
+        )
+
+        epsilon_free = cfg.epsilon_free()
+        self.assertEqual("S'", epsilon_free.initial_symbol)
+        self.assertDictEqual({
+            "S'": {('S',), ('&',)},
+            'S': {('a',)},
+            'A': {('b',)},
+        }, epsilon_free.productions)
+        self.assertNotIn('B', epsilon_free.terminals)
+
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'B'},
+                'A': {'b'},
+                'B': {'&'},
+            },
+        )
+
+        epsilon_free = cfg.epsilon_free()
+        self.assertDictEqual({
+            "S'": {('&',)},
+            'A': {('b',)},
+        }, epsilon_free.productions)
+        self.assertNotIn('S', epsilon_free.terminals)
+        self.assertNotIn('B', epsilon_free.terminals)
+
+    def test_str(self):
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {"T E'"},
+                "E'": {"+ T E'", '&'},
+                'T': {'( E )', 'id'},
+            },
+        )
+
+        self.assertListEqual([
+            "E -> T E'",
+            'T -> ( E ) | id',
+            "E' -> & | + T E'",
+        ], [line.strip() for line in str(cfg).splitlines()[1:-1]])
+
     def test_load(self):
         buf = io.StringIO("""
             E -> T E'
@@ -297,11 +494,11 @@ class CFGTest(unittest.TestCase):
         cfg = CFG.load(buf)
         self.assertEqual('E', cfg.initial_symbol)
         self.assertDictEqual({
-            'E': {"T E'"},
-            "E'": {"+ T E'", '&'},
-            'T': {"F T'"},
-            "T'": {"* F T'", '&'},
-            'F': {'( E )', 'id'}
+            'E': {('T', "E'")},
+            "E'": {('+', 'T', "E'"), ('&',)},
+            'T': {('F', "T'")},
+            "T'": {('*', 'F', "T'"), ('&',)},
+            'F': {('(', 'E', ')'), ('id',)}
         }, cfg.productions)
 
         buf = io.StringIO('')